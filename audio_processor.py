@@ -1,42 +1,212 @@
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from enum import Enum
+from typing import NamedTuple, Optional
 import ffmpeg
-from halo import Halo
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 from pathlib import Path
+from utils import PIPE_READ_SIZE, create_spinner
 
+# Keep ffmpeg away from the terminal and limit stderr to actual errors
+FFMPEG_GLOBAL_ARGS = ("-nostdin", "-nostats", "-loglevel", "error")
+
+# GCS XML multipart uploads reject parts smaller than this, except the last one
+MIN_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+
+class AudioEncoding(str, Enum):
+    """Audio encodings accepted by both ffmpeg and Speech-to-Text."""
+
+    OGG_OPUS = "ogg-opus"
+    FLAC = "flac"
+    LINEAR16 = "linear16"
+
+
+class AudioFormat(NamedTuple):
+    """How ffmpeg produces an encoding and how it is stored in GCS."""
+
+    ffmpeg_args: dict
+    content_type: str
+    extension: str
+    # Upper estimate of the encoded size including container overhead, used to
+    # pick an upload strategy
+    bytes_per_second: int
+
+
+# All encodings are 16 kHz mono, Opus at 24 kbps is ~10x smaller than PCM.
+# Opus is estimated at 32 kbps to cover its variable bitrate and Ogg framing.
+# FLAC compression varies, so its size is estimated as uncompressed PCM.
+AUDIO_FORMATS = {
+    AudioEncoding.OGG_OPUS: AudioFormat(
+        {"format": "ogg", "acodec": "libopus", "audio_bitrate": "24k"},
+        "audio/ogg",
+        "ogg",
+        4_000,
+    ),
+    AudioEncoding.FLAC: AudioFormat(
+        {"format": "flac", "acodec": "flac"}, "audio/flac", "flac", 32_000
+    ),
+    AudioEncoding.LINEAR16: AudioFormat(
+        {"format": "wav", "acodec": "pcm_s16le"}, "audio/wav", "wav", 32_000
+    ),
+}
+
+
+def _ffmpeg_output(input_file: Path, output: str, encoding: AudioEncoding):
+    """Builds the ffmpeg command converting a video's audio to the encoding."""
+    return (
+        ffmpeg.input(str(input_file))
+        .output(output, ac=1, ar="16000", **AUDIO_FORMATS[encoding].ffmpeg_args)
+        .global_args(*FFMPEG_GLOBAL_ARGS)
+    )
+
+
+@contextmanager
+def stream_audio(input_file: Path, encoding: AudioEncoding):
+    """Runs ffmpeg on a video file and yields its encoded audio stream.
+
+    Raises RuntimeError after the stream is consumed if ffmpeg failed.
+    """
+    proc = _ffmpeg_output(input_file, "pipe:", encoding).run_async(
+        pipe_stdout=True, pipe_stderr=True
+    )
+
+    # Drain stderr in the background so ffmpeg never blocks on a full pipe
+    stderr = []
+    stderr_thread = threading.Thread(
+        target=lambda: stderr.append(proc.stderr.read()), daemon=True
+    )
+    stderr_thread.start()
 
-def extract_audio(input_file: Path, output_file: Path):
-    """Extracts audio from a video file using ffmpeg."""
-    spinner = Halo(text="Step 1/4: Extracting audio from video...", spinner="dots")
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        stderr_thread.join()
+        proc.stderr.close()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"FFmpeg error: {b''.join(stderr).decode()}")
+
+
+def extract_audio(input_file: Path, encoding: AudioEncoding) -> bytes:
+    """Extracts audio from a video file into memory using ffmpeg."""
+    spinner = create_spinner("Step 1/3: Extracting audio from video...")
     try:
         spinner.start()
-        (
-            ffmpeg.input(str(input_file))
-            .output(str(output_file), acodec="pcm_s16le", ac=1, ar="16000")
-            .run(quiet=True, overwrite_output=True)
+        audio_bytes, _ = _ffmpeg_output(input_file, "pipe:", encoding).run(
+            capture_stdout=True, capture_stderr=True
         )
         spinner.succeed("Audio extracted successfully.")
+        return audio_bytes
     except ffmpeg.Error as e:
         spinner.fail("Error extracting audio with ffmpeg.")
         raise RuntimeError(f"FFmpeg error: {e.stderr.decode()}")
 
 
-def upload_audio_to_gcs(
-    local_path: Path, bucket_name: str, remote_blob_name: str, credentials
+def extract_and_upload(
+    input_file: Path,
+    blob: storage.Blob,
+    encoding: AudioEncoding,
+    chunk_size: int = 16 * 1024 * 1024,
+    max_workers: int = 8,
+    duration: Optional[float] = None,
 ):
-    """Uploads a local audio file to a Google Cloud Storage bucket."""
-    spinner = Halo(
-        text=f"Step 2/4: Uploading audio to GCS bucket '{bucket_name}'...",
-        spinner="dots",
+    """Extracts audio with ffmpeg and uploads it to a GCS blob.
+
+    The ffmpeg output is streamed directly into the upload when there is a
+    single worker, or when the audio's duration shows that the encoded file
+    fits in one chunk. Otherwise the audio is written to a temporary file first
+    so that it can be uploaded as concurrent chunks.
+    """
+    if chunk_size < MIN_UPLOAD_CHUNK_SIZE:
+        raise ValueError(
+            f"Upload chunk size must be at least {MIN_UPLOAD_CHUNK_SIZE} bytes."
+        )
+    spinner = create_spinner(
+        f"Step 1/3: Extracting and uploading audio to GCS bucket '{blob.bucket.name}'..."
     )
-    storage_client = storage.Client(credentials=credentials)
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(remote_blob_name)
+    spinner.start()
+    estimated_size = (
+        None
+        if duration is None
+        else duration * AUDIO_FORMATS[encoding].bytes_per_second
+    )
+    if max_workers > 1 and (estimated_size is None or estimated_size > chunk_size):
+        _extract_and_upload_concurrently(
+            input_file, blob, encoding, spinner, chunk_size, max_workers
+        )
+    else:
+        _extract_and_upload_stream(input_file, blob, encoding, spinner, chunk_size)
+
+    gcs_uri = f"gs://{blob.bucket.name}/{blob.name}"
+    spinner.succeed(f"Audio extracted and uploaded to {gcs_uri}")
+    return gcs_uri
+
+
+def _extract_and_upload_stream(
+    input_file: Path, blob, encoding: AudioEncoding, spinner, chunk_size: int
+):
+    """Pipes ffmpeg's output into a single resumable upload.
+
+    The upload is written through a blob writer because upload_from_file needs
+    to tell() the stream's position, which a pipe does not support.
+    """
+    content_type = AUDIO_FORMATS[encoding].content_type
     try:
-        spinner.start()
-        blob.upload_from_filename(str(local_path))
-        gcs_uri = f"gs://{bucket_name}/{remote_blob_name}"
-        spinner.succeed(f"Audio uploaded to {gcs_uri}")
-        return gcs_uri
+        # An ffmpeg error is raised inside the writer, which then cancels the
+        # upload instead of finalizing it with truncated audio
+        with blob.open("wb", chunk_size=chunk_size, content_type=content_type) as f:
+            with stream_audio(input_file, encoding) as audio_stream:
+                shutil.copyfileobj(audio_stream, f, PIPE_READ_SIZE)
+    except RuntimeError:
+        spinner.fail("Error extracting audio with ffmpeg.")
+        raise
     except Exception as e:
         spinner.fail("An error occurred during GCS upload.")
         raise RuntimeError(f"GCS upload error: {e}")
+
+
+def _extract_and_upload_concurrently(
+    input_file: Path,
+    blob,
+    encoding: AudioEncoding,
+    spinner,
+    chunk_size: int,
+    max_workers: int,
+):
+    """Extracts audio to a temporary file and uploads it in concurrent chunks."""
+    audio_format = AUDIO_FORMATS[encoding]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_audio_path = Path(temp_dir) / f"audio.{audio_format.extension}"
+        try:
+            _ffmpeg_output(input_file, str(temp_audio_path), encoding).run(
+                quiet=True, overwrite_output=True
+            )
+        except ffmpeg.Error as e:
+            spinner.fail("Error extracting audio with ffmpeg.")
+            raise RuntimeError(f"FFmpeg error: {e.stderr.decode()}")
+
+        try:
+            if temp_audio_path.stat().st_size <= chunk_size:
+                blob.upload_from_filename(
+                    str(temp_audio_path), content_type=audio_format.content_type
+                )
+            else:
+                transfer_manager.upload_chunks_concurrently(
+                    str(temp_audio_path),
+                    blob,
+                    content_type=audio_format.content_type,
+                    chunk_size=chunk_size,
+                    # Threads share the client's connection pool and each one
+                    # reads its own part of the file through the page cache
+                    worker_type=transfer_manager.THREAD,
+                    max_workers=max_workers,
+                )
+        except Exception as e:
+            spinner.fail("An error occurred during GCS upload.")
+            raise RuntimeError(f"GCS upload error: {e}")
@@ -1,16 +1,77 @@
+import ffmpeg
+import os
+import shutil
 import typer
-import tempfile
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 from typing_extensions import Annotated
+from google.cloud import speech, storage
 from google.oauth2 import service_account
 from google.api_core import exceptions as google_exceptions
-from halo import Halo
+from requests.adapters import HTTPAdapter
 
-from audio_processor import extract_audio, upload_audio_to_gcs
-from transcriber import transcribe_audio
+from audio_processor import (
+    AUDIO_FORMATS,
+    AudioEncoding,
+    extract_audio,
+    extract_and_upload,
+)
+from transcriber import transcribe_audio, transcribe_audio_streaming
 from srt_generator import generate_srt_file
+from utils import create_spinner, load_service_account_info
+
+# Synchronous recognition accepts roughly one minute of inline audio
+INLINE_AUDIO_MAX_DURATION = 55.0
+# Streaming recognition is limited to about five minutes of audio per stream
+STREAMING_AUDIO_MAX_DURATION = 290.0
+
+
+def _probe_duration(probe: dict) -> Optional[float]:
+    """Returns the duration in seconds from ffprobe output, or None if unknown.
+
+    Uses the container's duration and falls back to the audio stream's own.
+    """
+    for info in (probe.get("format", {}), probe["streams"][0]):
+        try:
+            return float(info["duration"])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def cleanup_gcs(
+    gcs_uri: Optional[str],
+    blob: Optional[storage.Blob],
+    pending_delete: Optional[Future] = None,
+):
+    """Deletes the temporary audio blob from the GCS bucket.
+
+    If the deletion was already started in the background, waits for
+    pending_delete to finish instead and reports its outcome.
+    """
+    spinner_cleanup = create_spinner(
+        f"🧹 Cleaning up: Deleting {gcs_uri} from bucket..."
+    )
+    spinner_cleanup.start()
+    if gcs_uri:
+        try:
+            if pending_delete is not None:
+                pending_delete.result()
+            else:
+                blob.delete()
+            spinner_cleanup.succeed("Cleanup complete, deleted blob from GCS bucket.")
+        except google_exceptions.NotFound:
+            spinner_cleanup.succeed(
+                "File already deleted or was not uploaded successfully."
+            )
+        except Exception as e:
+            spinner_cleanup.warn(
+                f"Warning: Failed to delete blob from GCS. Manual cleanup may be required. Error: {e}"
+            )
+    else:
+        spinner_cleanup.succeed("No GCS file to clean up.")
 
 
 def main(
@@ -63,6 +124,30 @@ def main(
             resolve_path=True,
         ),
     ] = Path("credentials.json"),
+    audio_encoding: Annotated[
+        AudioEncoding,
+        typer.Option(
+            "--audio-encoding",
+            "-e",
+            help="Encoding of the audio sent for transcription. 'flac' and 'linear16' are lossless, 'ogg-opus' is the smallest.",
+        ),
+    ] = AudioEncoding.OGG_OPUS,
+    upload_workers: Annotated[
+        int,
+        typer.Option(
+            "--upload-workers",
+            min=1,
+            help="Number of concurrent GCS upload workers. Use 1 to stream audio directly from ffmpeg to GCS.",
+        ),
+    ] = 8,
+    upload_chunk_size: Annotated[
+        int,
+        typer.Option(
+            "--upload-chunk-size",
+            min=5,
+            help="Size of each GCS upload chunk in MiB. GCS multipart uploads require at least 5 MiB.",
+        ),
+    ] = 16,
 ):
     """
     Extracts audio from an MP4 file, transcribes it using Google Speech-to-Text,
@@ -70,69 +155,127 @@ def main(
     """
     print(f"mp42srt processing file: {mp4_file.name}")
 
+    # Check ffmpeg and the input before doing any other setup work
+    if not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        print("❌ ffmpeg not found. Please install it and make sure it's in $PATH.")
+        raise typer.Exit(code=1)
+
+    try:
+        probe = ffmpeg.probe(str(mp4_file), select_streams="a:0")
+    except ffmpeg.Error as e:
+        print(
+            f"❌ Error probing {mp4_file.name} with ffmpeg. Details: {e.stderr.decode()}"
+        )
+        raise typer.Exit(code=1)
+    if not probe.get("streams"):
+        print(f"❌ {mp4_file.name} has no audio track to transcribe.")
+        raise typer.Exit(code=1)
+    duration = _probe_duration(probe)
+
     if output_srt is None:
         output_srt = mp4_file.with_suffix(".srt")
 
-    counter = 0
-    original_stem = output_srt.stem
-    while output_srt.exists():
-        new_filename = f"{original_stem}-{counter}{output_srt.suffix}"
-        output_srt = output_srt.with_name(new_filename)
-        counter += 1
-
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            str(credentials_file)
+        credentials = service_account.Credentials.from_service_account_info(
+            load_service_account_info(credentials_file)
         )
     except Exception as e:
         print(f"❌ Error loading credentials from {credentials_file}.")
         print(f"   Please ensure it's a valid service account JSON file. Details: {e}")
         raise typer.Exit(code=1)
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_wav_path = Path(temp_dir) / "audio.wav"
-        gcs_uri = None
+    # Reserve the first free output name atomically, one syscall per attempt
+    counter = 0
+    original_stem = output_srt.stem
+    output_fd = None
+    try:
+        while output_fd is None:
+            try:
+                # Same permissions as open() would give, after the umask
+                output_fd = os.open(
+                    str(output_srt), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666
+                )
+            except FileExistsError:
+                new_filename = f"{original_stem}-{counter}{output_srt.suffix}"
+                output_srt = output_srt.with_name(new_filename)
+                counter += 1
+        srt_file = os.fdopen(output_fd, "wb", buffering=1 << 20)
+    except OSError as e:
+        print(f"❌ Error creating output file {output_srt}. Details: {e}")
+        raise typer.Exit(code=1)
+    srt_written = False
 
-        try:
-            extract_audio(mp4_file, temp_wav_path)
-            remote_blob_name = f"audio-transcripts/{uuid.uuid4()}.wav"
-            gcs_uri = upload_audio_to_gcs(
-                temp_wav_path, gcs_bucket_name, remote_blob_name, credentials
-            )
-            response = transcribe_audio(gcs_uri, language_code, credentials)
-            generate_srt_file(response, output_srt)
+    # Audio of unknown length goes through GCS, which has no duration limit
+    use_inline_audio = duration is not None and duration < INLINE_AUDIO_MAX_DURATION
+    use_streaming = (
+        duration is not None
+        and not use_inline_audio
+        and duration < STREAMING_AUDIO_MAX_DURATION
+    )
+    gcs_uri = None
+    blob = None
+    pending_delete = None
 
-        except Exception as e:
-            print(f"❌ An error occurred: {e}")
-            raise typer.Exit(code=1)
-        finally:
-            spinner_cleanup = Halo(
-                text=f"🧹 Cleaning up: Deleting {gcs_uri} from bucket...",
-                spinner="dots",
+    try:
+        speech_client = speech.SpeechClient(credentials=credentials)  # type: ignore
+        if use_inline_audio:
+            audio_bytes = extract_audio(mp4_file, audio_encoding)
+            response = transcribe_audio(
+                speech_client,
+                None,
+                language_code,
+                audio_encoding,
+                audio_bytes=audio_bytes,
+            )
+        elif use_streaming:
+            response = transcribe_audio_streaming(
+                speech_client, mp4_file, language_code, audio_encoding
+            )
+        else:
+            storage_client = storage.Client(credentials=credentials)
+            # Replace the session's default adapter on purpose, only to keep one
+            # pooled connection per concurrent upload worker. Its retry
+            # settings are carried over to the new adapter.
+            session = storage_client._http
+            session.mount(
+                "https://",
+                HTTPAdapter(
+                    pool_maxsize=max(upload_workers, 16),
+                    max_retries=session.get_adapter("https://").max_retries,
+                ),
+            )
+            bucket = storage_client.bucket(gcs_bucket_name)
+            extension = AUDIO_FORMATS[audio_encoding].extension
+            blob = bucket.blob(f"audio-transcripts/{uuid.uuid4()}.{extension}")
+            gcs_uri = extract_and_upload(
+                mp4_file,
+                blob,
+                audio_encoding,
+                chunk_size=upload_chunk_size * 1024 * 1024,
+                max_workers=upload_workers,
+                duration=duration,
             )
-            spinner_cleanup.start()
+            response = transcribe_audio(
+                speech_client, gcs_uri, language_code, audio_encoding
+            )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
             if gcs_uri:
-                try:
-                    from google.cloud import storage
-
-                    storage_client = storage.Client(credentials=credentials)
-                    bucket = storage_client.bucket(gcs_bucket_name)
-                    remote_blob_name = "/".join(gcs_uri.split("/")[3:])
-                    blob = bucket.blob(remote_blob_name)
-                    blob.delete()
-                    spinner_cleanup.succeed(
-                        "Cleanup complete, deleted blob from GCS bucket."
-                    )
-                except google_exceptions.NotFound:
-                    spinner_cleanup.succeed(
-                        "File already deleted or was not uploaded successfully."
-                    )
-                except Exception as e:
-                    spinner_cleanup.warn(
-                        f"Warning: Failed to delete blob from GCS. Manual cleanup may be required. Error: {e}"
-                    )
-            else:
-                spinner_cleanup.succeed("No GCS file to clean up.")
+                # The audio is no longer needed, delete it while the SRT is generated
+                pending_delete = executor.submit(blob.delete)
+            generate_srt_file(response, output_srt, srt_file)
+            srt_written = True
+
+    except Exception as e:
+        print(f"❌ An error occurred: {e}")
+        raise typer.Exit(code=1)
+    finally:
+        srt_file.close()
+        if not srt_written:
+            # Don't leave the reserved, empty output file behind
+            output_srt.unlink()
+        if not (use_inline_audio or use_streaming):
+            cleanup_gcs(gcs_uri, blob, pending_delete)
 
 
 if __name__ == "__main__":
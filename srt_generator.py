@@ -1,83 +1,140 @@
-from halo import Halo
 from pathlib import Path
-from utils import format_timestamp
+from typing import BinaryIO, Optional
+from utils import create_spinner, format_timestamp
 
+# Words ending in one of these close a sentence and start a new subtitle
+_PUNCT = frozenset(".?!")
 
-def generate_srt_file(response, output_path: Path):
-    """Generates an SRT subtitle file from a Google Speech-to-Text response."""
-    spinner = Halo(text="Step 4/4: Generating SRT subtitle file...", spinner="dots")
+
+def _word_lists(words):
+    """Extracts word texts and timings from a recognition result into lists."""
+    texts = [w.word.strip() for w in words]
+    starts = [w.start_time.total_seconds() for w in words]
+    ends = [w.end_time.total_seconds() for w in words]
+    return texts, starts, ends
+
+
+# Split finder source, specialized per set of subtitle limits by make_splitter
+_SPLITTER_TEMPLATE = """
+def find_split_indices(starts, ends, char_lens, punct_mask):
+    splits = [0]
+    block_start = 0
+    running_len = char_lens[0]
+    for i in range(1, len(char_lens)):
+        new_len = running_len + 1 + char_lens[i]
+        if (
+            new_len > {max_chars_per_line!r}
+            or ends[i] - starts[block_start] > {max_line_duration!r}
+            or punct_mask[i]
+        ):
+            splits.append(i)
+            block_start = i
+            running_len = char_lens[i]
+        else:
+            running_len = new_len
+    return splits
+"""
+
+_SPLITTERS = {}
+
+
+def make_splitter(max_chars_per_line: int, max_line_duration: float):
+    """Returns a split finder with the subtitle limits compiled in as literals.
+
+    The returned function takes lists of word start/end times, character lengths
+    and punctuation flags, and returns the index of the first word of every
+    subtitle block. Splitters are cached per set of limits.
+    """
+    key = (int(max_chars_per_line), float(max_line_duration))
+    splitter = _SPLITTERS.get(key)
+    if splitter is None:
+        source = _SPLITTER_TEMPLATE.format(
+            max_chars_per_line=key[0], max_line_duration=key[1]
+        )
+        namespace = {}
+        exec(source, namespace)
+        splitter = namespace["find_split_indices"]
+        _SPLITTERS[key] = splitter
+    return splitter
+
+
+def _split_indices(
+    texts,
+    starts,
+    ends,
+    max_chars_per_line: int,
+    max_line_duration: float,
+):
+    """Returns the index of the first word of every subtitle block as a list."""
+    char_lens = [len(text) for text in texts]
+    punct_mask = [text[-1:] in _PUNCT for text in texts]
+    find_split_indices = make_splitter(max_chars_per_line, max_line_duration)
+    return find_split_indices(starts, ends, char_lens, punct_mask)
+
+
+def _format_blocks(texts, starts, ends, splits, base_index: int) -> bytearray:
+    """Formats the subtitle blocks of one recognition result as SRT bytes."""
+    srt_content = bytearray()
+    block_bounds = zip(splits, splits[1:] + [len(texts)])
+    for subtitle_index, (block_start, block_end) in enumerate(block_bounds, base_index):
+        transcript_line = " ".join(texts[block_start:block_end])
+        srt_content += b"%d\n%s --> %s\n%s\n\n" % (
+            subtitle_index,
+            format_timestamp(starts[block_start]).encode(),
+            format_timestamp(ends[block_end - 1]).encode(),
+            transcript_line.strip().encode("utf-8"),
+        )
+    return srt_content
+
+
+def _srt_chunks(response, max_chars_per_line: int, max_line_duration: float):
+    """Yields the SRT bytes of every recognition result, numbered continuously.
+
+    The last subtitle block is terminated by a single newline.
+    """
+    subtitle_index = 1
+    pending = None
+    for result in response.results:
+        if not result.alternatives[0].words:
+            continue
+        texts, starts, ends = _word_lists(result.alternatives[0].words)
+        splits = _split_indices(
+            texts,
+            starts,
+            ends,
+            max_chars_per_line,
+            max_line_duration,
+        )
+        if pending is not None:
+            yield pending
+        pending = _format_blocks(texts, starts, ends, splits, subtitle_index)
+        subtitle_index += len(splits)
+    if pending is not None:
+        del pending[-1:]
+        yield pending
+
+
+def generate_srt_file(
+    response, output_path: Path, output_file: Optional[BinaryIO] = None
+):
+    """Generates an SRT subtitle file from a Google Speech-to-Text response.
+
+    Writes to output_file if one is given, e.g. a file reserved by the caller,
+    otherwise creates output_path.
+    """
+    spinner = create_spinner("Step 3/3: Generating SRT subtitle file...")
     try:
         spinner.start()
-        srt_content = []
-        subtitle_index = 1
         max_chars_per_line = 42
         max_line_duration = 3.5
-        max_lines_per_subtitle = 2
-
-        for result in response.results:
-            if not result.alternatives[0].words:
-                continue
-            words = result.alternatives[0].words
-            current_subtitle_words = []
-            current_subtitle_start_time = 0.0
-
-            # Iterate through words to build subtitle blocks
-            for word_info in words:
-                word = word_info.word.strip()
-
-                # Set the start time for the first word in the subtitle
-                if not current_subtitle_words:
-                    current_subtitle_start_time = word_info.start_time.total_seconds()
-
-                # Check if adding the new word would break the rules
-                temp_line = " ".join([w.word for w in current_subtitle_words] + [word])
-                temp_lines = temp_line.split("\n")
-
-                # Logic to check for splits
-                should_split = False
-                if len(temp_lines) > max_lines_per_subtitle:
-                    should_split = True
-                elif len(temp_line) > max_chars_per_line and len(temp_lines) > 1:
-                    should_split = True
-                elif (
-                    word_info.end_time.total_seconds() - current_subtitle_start_time
-                ) > max_line_duration:
-                    should_split = True
-                elif word.endswith((".", "?", "!")):
-                    should_split = True
-
-                # If a split is needed, save the current subtitle and start a new one
-                if should_split and current_subtitle_words:
-                    end_time = current_subtitle_words[-1].end_time.total_seconds()
-                    transcript_line = " ".join([w.word for w in current_subtitle_words])
-
-                    srt_content.append(str(subtitle_index))
-                    srt_content.append(
-                        f"{format_timestamp(current_subtitle_start_time)} --> {format_timestamp(end_time)}"
-                    )
-                    srt_content.append(transcript_line.strip())
-                    srt_content.append("")
-                    subtitle_index += 1
-
-                    current_subtitle_words = [word_info]
-                    current_subtitle_start_time = word_info.start_time.total_seconds()
-                else:
-                    # Append the word to the current line
-                    current_subtitle_words.append(word_info)
-
-            # Append any remaining words as the final subtitle
-            if current_subtitle_words:
-                end_time = current_subtitle_words[-1].end_time.total_seconds()
-                transcript_line = " ".join([w.word for w in current_subtitle_words])
-                srt_content.append(str(subtitle_index))
-                srt_content.append(
-                    f"{format_timestamp(current_subtitle_start_time)} --> {format_timestamp(end_time)}"
-                )
-                srt_content.append(transcript_line.strip())
-                srt_content.append("")
-
-        with open(str(output_path), "w", encoding="utf-8") as f:
-            f.write("\n".join(srt_content))
+
+        # Each result is written as soon as it is formatted, so only one
+        # result's subtitles are held in memory at a time
+        srt_chunks = _srt_chunks(response, max_chars_per_line, max_line_duration)
+        if output_file is None:
+            output_file = open(str(output_path), "wb", buffering=1 << 20)
+        with output_file as f:
+            f.writelines(srt_chunks)
 
         spinner.succeed(f"SRT file saved to: {output_path}")
 
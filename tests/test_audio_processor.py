@@ -0,0 +1,156 @@
+import base64
+import json
+import subprocess
+import sys
+import unittest
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import google_crc32c
+import requests
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+import audio_processor
+from audio_processor import AudioEncoding
+
+
+class FakeResumableSession(requests.Session):
+    """Answers GCS resumable upload requests and records the uploaded data."""
+
+    is_mtls = False
+
+    def __init__(self):
+        super().__init__()
+        self.uploaded = bytearray()
+        self.headers_seen = []
+        self.cancelled = False
+
+    def request(self, method, url, data=None, headers=None, **kwargs):
+        self.headers_seen.append(headers or {})
+        response = requests.Response()
+        response.request = requests.Request(method, url).prepare()
+        if method == "POST":
+            response.status_code = 200
+            response.headers["location"] = "https://upload.example/session"
+        elif method == "DELETE":
+            self.cancelled = True
+            response.status_code = 499
+        else:
+            self.uploaded += data.read() if hasattr(data, "read") else data
+            total = headers["content-range"].rsplit("/", 1)[1]
+            if total == "*":
+                response.status_code = 308
+                response.headers["range"] = f"bytes=0-{len(self.uploaded) - 1}"
+            else:
+                response.status_code = 200
+                crc32c = google_crc32c.value(bytes(self.uploaded)).to_bytes(4, "big")
+                response._content = json.dumps(
+                    {
+                        "name": "audio.ogg",
+                        "size": str(len(self.uploaded)),
+                        "crc32c": base64.b64encode(crc32c).decode(),
+                    }
+                ).encode()
+        return response
+
+
+@contextmanager
+def _pipe_stream(payload: bytes, returncode: int = 0):
+    """Stands in for stream_audio, yielding a real subprocess pipe."""
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    proc.stdin.write(payload)
+    proc.stdin.close()
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if returncode != 0:
+        raise RuntimeError("FFmpeg error: failed")
+
+
+class ExtractAndUploadStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeResumableSession()
+        client = storage.Client(
+            project="test", credentials=AnonymousCredentials(), _http=self.session
+        )
+        self.blob = client.bucket("bucket").blob("audio.ogg")
+        self.spinner = mock.Mock()
+
+    def _upload(self, payload: bytes, returncode: int = 0):
+        with mock.patch.object(
+            audio_processor,
+            "stream_audio",
+            lambda *args: _pipe_stream(payload, returncode),
+        ):
+            audio_processor._extract_and_upload_stream(
+                Path("video.mp4"),
+                self.blob,
+                AudioEncoding.OGG_OPUS,
+                self.spinner,
+                audio_processor.MIN_UPLOAD_CHUNK_SIZE,
+            )
+
+    def test_uploads_pipe_in_chunks(self):
+        payload = bytes(range(256)) * (3 * audio_processor.MIN_UPLOAD_CHUNK_SIZE // 256)
+        payload += b"tail"
+        self._upload(payload)
+        self.assertEqual(self.session.uploaded, payload)
+        self.assertEqual(
+            self.session.headers_seen[0]["x-upload-content-type"], "audio/ogg"
+        )
+        self.spinner.fail.assert_not_called()
+
+    def test_ffmpeg_error_cancels_upload(self):
+        payload = b"x" * (audio_processor.MIN_UPLOAD_CHUNK_SIZE + 1)
+        with self.assertRaisesRegex(RuntimeError, "FFmpeg error"):
+            self._upload(payload, returncode=1)
+        self.assertTrue(self.session.cancelled)
+        self.spinner.fail.assert_called_once()
+
+
+class ExtractAndUploadRoutingTest(unittest.TestCase):
+    def _route(self, duration, max_workers=8):
+        blob = mock.Mock()
+        with (
+            mock.patch.object(audio_processor, "_extract_and_upload_stream") as stream,
+            mock.patch.object(
+                audio_processor, "_extract_and_upload_concurrently"
+            ) as concurrent,
+        ):
+            audio_processor.extract_and_upload(
+                Path("video.mp4"),
+                blob,
+                AudioEncoding.OGG_OPUS,
+                chunk_size=16 * 1024 * 1024,
+                max_workers=max_workers,
+                duration=duration,
+            )
+        return "stream" if stream.called else "concurrent"
+
+    def test_audio_fitting_in_one_chunk_is_streamed(self):
+        self.assertEqual(self._route(600.0), "stream")
+
+    def test_long_audio_is_uploaded_concurrently(self):
+        self.assertEqual(self._route(3 * 3600.0), "concurrent")
+
+    def test_unknown_duration_is_uploaded_concurrently(self):
+        self.assertEqual(self._route(None), "concurrent")
+
+    def test_single_worker_always_streams(self):
+        self.assertEqual(self._route(3 * 3600.0, max_workers=1), "stream")
+
+
+if __name__ == "__main__":
+    unittest.main()
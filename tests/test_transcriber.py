@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import audio_processor
+import transcriber
+from audio_processor import AudioEncoding
+
+
+class FakeSpeechClient:
+    """Consumes every streaming request and returns no results."""
+
+    def __init__(self):
+        self.audio = b""
+
+    def streaming_recognize(self, config, requests):
+        self.audio = b"".join(request.audio_content for request in requests)
+        return []
+
+
+class TranscribeAudioStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeSpeechClient()
+        self.spinner = mock.Mock()
+
+    def _transcribe(self, fake_ffmpeg: str):
+        """Runs a streaming transcription with a Python script standing in for ffmpeg."""
+        output = mock.Mock()
+        output.run_async.side_effect = lambda **kwargs: subprocess.Popen(
+            [sys.executable, "-c", fake_ffmpeg],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        with mock.patch.object(audio_processor, "_ffmpeg_output", return_value=output):
+            with mock.patch.object(
+                transcriber, "create_spinner", return_value=self.spinner
+            ):
+                return transcriber.transcribe_audio_streaming(
+                    self.client, Path("video.mp4"), "en-US", AudioEncoding.OGG_OPUS
+                )
+
+    def test_streams_ffmpeg_output(self):
+        response = self._transcribe("import sys; sys.stdout.write('a' * 10000)")
+        self.assertEqual(self.client.audio, b"a" * 10000)
+        self.assertEqual(len(response.results), 0)
+        self.spinner.succeed.assert_called_once()
+        self.spinner.fail.assert_not_called()
+
+    def test_ffmpeg_error_fails_spinner(self):
+        with self.assertRaisesRegex(RuntimeError, "FFmpeg error: broken"):
+            self._transcribe("import sys; sys.stderr.write('broken'); sys.exit(1)")
+        self.spinner.succeed.assert_not_called()
+        self.spinner.fail.assert_called_once_with("Error extracting audio with ffmpeg.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,30 +1,101 @@
+from pathlib import Path
+from typing import Optional
 from google.cloud import speech
-from google.oauth2.service_account import Credentials
-from halo import Halo
+from audio_processor import AudioEncoding, stream_audio
+from utils import create_spinner, iter_chunks
 
+# 100 ms of 16 kHz mono 16-bit PCM, the recommended streaming frame size.
+# Compressed encodings fit proportionally more audio into each request.
+STREAMING_CHUNK_SIZE = 3200
 
-def transcribe_audio(gcs_uri: str, language_code: str, credentials: Credentials):
-    """Transcribes an audio file from GCS using the Speech-to-Text API."""
-    spinner = Halo(
-        text="Step 3/4: Transcribing audio (this may take a while)...", spinner="dots"
+
+def _recognition_config(language_code: str, encoding: AudioEncoding):
+    """Builds the recognition config for 16 kHz mono audio in the encoding."""
+    return speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[encoding.name],
+        sample_rate_hertz=16000,
+        language_code=language_code,
+        enable_word_time_offsets=True,
+        enable_automatic_punctuation=True,
     )
+
+
+def transcribe_audio(
+    speech_client: speech.SpeechClient,
+    gcs_uri: Optional[str],
+    language_code: str,
+    encoding: AudioEncoding,
+    audio_bytes: Optional[bytes] = None,
+):
+    """Transcribes audio using the Speech-to-Text API.
+
+    Inline audio_bytes are recognized synchronously, otherwise the audio file
+    at gcs_uri is transcribed with a long-running operation.
+    """
+    spinner = create_spinner("Step 2/3: Transcribing audio (this may take a while)...")
     try:
-        speech_client = speech.SpeechClient(credentials=credentials)  # type: ignore
-        audio = speech.RecognitionAudio(uri=gcs_uri)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code=language_code,
-            enable_word_time_offsets=True,
-            enable_automatic_punctuation=True,
-        )
-        request = speech.LongRunningRecognizeRequest(config=config, audio=audio)
+        config = _recognition_config(language_code, encoding)
 
         spinner.start()
-        operation = speech_client.long_running_recognize(request=request)
-        response = operation.result(timeout=900)
+        if audio_bytes is not None:
+            audio = speech.RecognitionAudio(content=audio_bytes)
+            response = speech_client.recognize(config=config, audio=audio)
+        else:
+            audio = speech.RecognitionAudio(uri=gcs_uri)
+            request = speech.LongRunningRecognizeRequest(config=config, audio=audio)
+            operation = speech_client.long_running_recognize(request=request)
+            response = operation.result(timeout=900)
         spinner.succeed("Transcription complete.")
         return response
     except Exception as e:
         spinner.fail("An error occurred during transcription.")
         raise RuntimeError(f"Transcription error: {e}")
+
+
+def transcribe_audio_streaming(
+    speech_client: speech.SpeechClient,
+    input_file: Path,
+    language_code: str,
+    encoding: AudioEncoding,
+):
+    """Transcribes a video's audio with streaming recognition while ffmpeg extracts it.
+
+    Returns a RecognizeResponse holding the final results, so it can be used in
+    place of the response of transcribe_audio.
+    """
+    spinner = create_spinner(
+        "Steps 1-2/3: Extracting and transcribing audio (this may take a while)..."
+    )
+    try:
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=_recognition_config(language_code, encoding), interim_results=False
+        )
+
+        spinner.start()
+        # ffmpeg's exit status is checked when the stream is closed, which has
+        # to happen before the transcription is reported as complete
+        with stream_audio(input_file, encoding) as audio_stream:
+            requests = (
+                speech.StreamingRecognizeRequest(audio_content=chunk)
+                for chunk in iter_chunks(audio_stream, STREAMING_CHUNK_SIZE)
+            )
+            responses = speech_client.streaming_recognize(
+                config=streaming_config, requests=requests
+            )
+            results = [
+                speech.SpeechRecognitionResult(
+                    alternatives=result.alternatives,
+                    language_code=result.language_code,
+                )
+                for response in responses
+                for result in response.results
+                if result.is_final
+            ]
+        spinner.succeed("Transcription complete.")
+        return speech.RecognizeResponse(results=results)
+    except RuntimeError:
+        spinner.fail("Error extracting audio with ffmpeg.")
+        raise
+    except Exception as e:
+        spinner.fail("An error occurred during transcription.")
+        raise RuntimeError(f"Transcription error: {e}")
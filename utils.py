@@ -1,11 +1,84 @@
+import json
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+from halo import Halo
+
+# Read pipes in large blocks to keep the number of read syscalls low
+PIPE_READ_SIZE = 1 << 20
+
+
 def format_timestamp(seconds: float) -> str:
     """Converts a time in seconds to the SRT timestamp format (HH:MM:SS,ms)."""
     assert seconds >= 0, "non-negative timestamp expected"
-    milliseconds = round(seconds * 1000.0)
-    hours = milliseconds // 3_600_000
-    milliseconds %= 3_600_000
-    minutes = milliseconds // 60_000
-    milliseconds %= 60_000
-    seconds = milliseconds // 1_000
-    milliseconds %= 1_000
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+    return _format_milliseconds(round(seconds * 1000.0))
+
+
+@lru_cache(maxsize=4096)
+def _format_milliseconds(milliseconds: int) -> str:
+    """Formats whole milliseconds as HH:MM:SS,ms, cached per distinct value."""
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, milliseconds)
+
+
+@lru_cache(maxsize=None)
+def load_service_account_info(path: Path) -> dict:
+    """Reads and parses a service account JSON key file once per path."""
+    return json.loads(Path(path).read_bytes())
+
+
+def iter_chunks(stream: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """Reads a pipe in large blocks and yields them in pieces of chunk_size.
+
+    Every block is read into the same preallocated buffer, so the only copies
+    made are the yielded chunks themselves.
+    """
+    buffer = bytearray(PIPE_READ_SIZE)
+    view = memoryview(buffer)
+    while True:
+        # At most one read from the pipe, returning whatever is available
+        size = stream.readinto1(buffer)
+        if not size:
+            return
+        for offset in range(0, size, chunk_size):
+            yield bytes(view[offset : min(offset + chunk_size, size)])
+
+
+class _NullSpinner:
+    """Stands in for Halo when output is not a terminal, printing only results."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def start(self):
+        return self
+
+    def stop(self):
+        return self
+
+    def _persist(self, symbol: str, text: Optional[str]):
+        print(f"{symbol} {text or self.text}", flush=True)
+        return self
+
+    def succeed(self, text: Optional[str] = None):
+        return self._persist("✔", text)
+
+    def fail(self, text: Optional[str] = None):
+        return self._persist("✖", text)
+
+    def warn(self, text: Optional[str] = None):
+        return self._persist("⚠", text)
+
+
+def create_spinner(text: str):
+    """Creates a Halo spinner, or a plain printer when stdout is not a terminal.
+
+    Halo redraws from a background thread several times a second, which is
+    wasted work and noise in pipes, CI logs and nohup runs.
+    """
+    if sys.stdout.isatty():
+        return Halo(text=text, spinner="dots")
+    return _NullSpinner(text)